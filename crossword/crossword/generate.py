@@ -1,4 +1,8 @@
+import heapq
 import sys
+from collections import deque
+
+import numpy as np
 
 from crossword import *
 
@@ -10,11 +14,79 @@ class CrosswordCreator():
         Create new CSP crossword generate.
         """
         self.crossword = crossword
-        self.domains = {
-            var: self.crossword.words.copy()
-            for var in self.crossword.variables
+
+        # give each variable an integer id and cache its neighbors and overlaps
+        self.variables = list(self.crossword.variables)
+        self.var_ids = {var: k for k, var in enumerate(self.variables)}
+        self._neighbors = [
+            [self.var_ids[neighbor] for neighbor in self.crossword.neighbors(var)]
+            for var in self.variables
+        ]
+        self._overlap = {
+            (self.var_ids[x], self.var_ids[y]): overlap
+            for (x, y), overlap in self.crossword.overlaps.items()
+            if overlap is not None
         }
 
+        # index every word so that domains can be stored as packed bitmasks
+        self.words = sorted(self.crossword.words)
+        self.word_ids = {word: k for k, word in enumerate(self.words)}
+        self.blocks = -(-len(self.words) // 64)  # uint64 blocks per bitmask
+        all_words = self.word_mask(range(len(self.words)))
+        self.domains = [all_words.copy() for _ in self.variables]
+
+        # every character used in the words, and its row in a letter stack
+        self.alphabet = sorted(set("".join(self.words)))
+        self.letter_ids = {char: c for c, char in enumerate(self.alphabet)}
+
+        # by_letter_at[var][pos] -> stack of bitmasks with one row per letter
+        # of the alphabet, holding the words with that letter at pos
+        self.by_letter_at = [None for _ in self.variables]
+
+        # letter_index[var][pos] -> which letters are present at pos in var's
+        # domain, filled lazily and cleared whenever the domain of var is revised
+        self.letter_index = [dict() for _ in self.variables]
+
+    def word_mask(self, indices):
+        """
+        Return a bitmask with the bits for the given word indices set.
+        """
+        bits = np.zeros(self.blocks * 64, dtype=np.uint8)
+        bits[np.asarray(indices, dtype=np.intp)] = 1
+        return self.pack(bits)
+
+    def pack(self, bits):
+        """
+        Pack an array of 0/1 values along its last axis into uint64 bitmasks.
+        """
+        return np.packbits(bits, axis=-1, bitorder="little").view(np.uint64)
+
+    def domain_words(self, var):
+        """
+        Return the list of words currently in the domain of variable id `var`.
+        """
+        bits = np.unpackbits(self.domains[var].view(np.uint8), bitorder="little")
+        return [self.words[k] for k in np.flatnonzero(bits)]
+
+    def active_letters(self, var, pos):
+        """
+        Return a boolean array over the alphabet marking the characters found
+        at position `pos` of the words currently in the domain of variable
+        id `var`.
+        """
+        letters = self.letter_index[var].get(pos)
+        if letters is None:
+            letters = (self.by_letter_at[var][pos] & self.domains[var]).any(axis=1)
+            self.letter_index[var][pos] = letters
+        return letters
+
+    def popcount(self, mask):
+        """
+        Return the number of words in the bitmask `mask`, or in each row of
+        a stack of bitmasks.
+        """
+        return np.unpackbits(mask.view(np.uint8), axis=-1).sum(axis=-1)
+
     def letter_grid(self, assignment):
         """
         Return 2D array representing a given assignment.
@@ -62,26 +134,28 @@ class CrosswordCreator():
             "black"
         )
         font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
-        draw = ImageDraw.Draw(img)
+
+        # Render a blank cell and each letter's cell once; cells are pasted below
+        # (one pixel wider than the interior, as drawn rectangles included both corners)
+        white_tile = Image.new("RGBA", (interior_size + 1, interior_size + 1), "white")
+        letter_tiles = dict()
+        for letter in set("".join(assignment.values())):
+            tile = white_tile.copy()
+            draw = ImageDraw.Draw(tile)
+            _, _, w, h = draw.textbbox((0, 0), letter, font=font)
+            draw.text(
+                ((interior_size - w) / 2, (interior_size - h) / 2 - 10),
+                letter, fill="black", font=font
+            )
+            letter_tiles[letter] = tile
 
         for i in range(self.crossword.height):
             for j in range(self.crossword.width):
-
-                rect = [
-                    (j * cell_size + cell_border,
-                     i * cell_size + cell_border),
-                    ((j + 1) * cell_size - cell_border,
-                     (i + 1) * cell_size - cell_border)
-                ]
                 if self.crossword.structure[i][j]:
-                    draw.rectangle(rect, fill="white")
-                    if letters[i][j]:
-                        _, _, w, h = draw.textbbox((0, 0), letters[i][j], font=font)
-                        draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
-                            letters[i][j], fill="black", font=font
-                        )
+                    img.paste(
+                        letter_tiles.get(letters[i][j], white_tile),
+                        (j * cell_size + cell_border, i * cell_size + cell_border)
+                    )
 
         img.save(filename)
 
@@ -99,12 +173,36 @@ class CrosswordCreator():
         (Remove any values that are inconsistent with a variable's unary
          constraints; in this case, the length of the word.)
         """
-        for var in self.crossword.variables:
-            new_words = set()  # maintain new words
-            for word in self.domains[var]:
-                if len(word) == var.length:  # check unary constraint
-                    new_words.add(word)  # add word if consistent
-            self.domains[var] = new_words  # assign node consistent words to domain
+        # group word indices by length
+        words_by_length = dict()
+        for k, word in enumerate(self.words):
+            words_by_length.setdefault(len(word), []).append(k)
+
+        # pack each length class into an (n, length) array of letter ids
+        # and build the stack of bitmasks of words with each letter at each position
+        letters_by_length = dict()
+        for length, ks in words_by_length.items():
+            codes = np.array(
+                [[self.letter_ids[char] for char in self.words[k]] for k in ks],
+                dtype=np.intp
+            ).reshape(len(ks), length)
+            positions = []
+            for pos in range(length):
+                bits = np.zeros((len(self.alphabet), self.blocks * 64), dtype=np.uint8)
+                bits[codes[:, pos], ks] = 1
+                positions.append(self.pack(bits))
+            letters_by_length[length] = positions
+
+        no_words = np.zeros((len(self.alphabet), self.blocks), dtype=np.uint64)
+        for var, variable in enumerate(self.variables):
+            # check unary constraint
+            self.domains[var] = self.domains[var] & self.word_mask(
+                words_by_length.get(variable.length, [])
+            )
+            self.by_letter_at[var] = letters_by_length.get(
+                variable.length, [no_words for _ in range(variable.length)]
+            )
+            self.letter_index[var].clear()
 
     def revise(self, x, y):
         """
@@ -115,32 +213,30 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        revised = False
+        return self._revise(self.var_ids[x], self.var_ids[y])
 
-        if self.crossword.overlaps[x, y] is None:  # return if no overlap
-            return revised
-        else:
-            x_char_index = self.crossword.overlaps[x, y][0]  # x's character
-            y_char_index = self.crossword.overlaps[x, y][1]  # y's matching position
-
-            x_words = self.domains[x]
-            new_words = set()
-
-            # for each word in x's domain check if any word in y has same character at intersection
-            for word in x_words:
-                is_consistent = False
-                for word_y in self.domains[y]:
-                    if word[x_char_index] == word_y[y_char_index]:
-                        is_consistent = True  # consistent so break
-                        break
-
-                if is_consistent:
-                    new_words.add(word)  # add word
-                else:
-                    revised = True  # if some word missed means revised
+    def _revise(self, x, y):
+        """
+        Make variable id `x` arc consistent with variable id `y`, as `revise`.
+        """
+        if (x, y) not in self._overlap:  # return if no overlap
+            return False
+
+        x_char_index, y_char_index = self._overlap[x, y]
+
+        # characters still available at the intersection in y's domain
+        active = self.active_letters(y, y_char_index)
+
+        # nothing to prune if every character of x at the intersection is supported
+        if not (self.active_letters(x, x_char_index) & ~active).any():
+            return False
 
-            self.domains[x] = new_words
-            return revised
+        # keep only x's words whose character at the intersection is active
+        self.domains[x] = np.bitwise_or.reduce(
+            self.by_letter_at[x][x_char_index][active], axis=0
+        ) & self.domains[x]
+        self.letter_index[x].clear()
+        return True
 
     def ac3(self, arcs=None):
         """
@@ -151,23 +247,33 @@ class CrosswordCreator():
         Return True if arc consistency is enforced and no domains are empty;
         return False if one or more domains end up empty.
         """
-        arcs_list = []
         if arcs is not None:
-            arcs_list = arcs
+            arcs = [(self.var_ids[x], self.var_ids[y]) for x, y in arcs]
+        return self._ac3(arcs)
+
+    def _ac3(self, arcs=None):
+        """
+        Enforce arc consistency as `ac3`, with `arcs` given as pairs of
+        variable ids.
+        """
+        if arcs is not None:
+            arcs_list = deque(arcs)
         else:
-            # create a list of arcs
-            for vars in self.crossword.overlaps:
-                arcs_list.append((vars[0], vars[1]))
-
-        while len(arcs_list) != 0:
-            arc = arcs_list.pop(0)  # take the frst variable in list
-            if self.revise(arc[0], arc[1]):  # revise each arc
-                if len(self.domains[arc[0]]) == 0:  # no solution possible
+            # create a queue of arcs between overlapping variables
+            arcs_list = deque(self._overlap)
+        in_queue = set(arcs_list)  # arcs waiting in the queue
+
+        while arcs_list:
+            x, y = arcs_list.popleft()  # take the first arc in the queue
+            in_queue.discard((x, y))
+            if self._revise(x, y):  # revise each arc
+                if not self.domains[x].any():  # no solution possible
                     return False
                 # update arcs_list to re-revise with new domains
-                for z in self.crossword.neighbors(arc[0]):
-                    if z != arc[1]:
-                        arcs_list.append((z, arc[0]))
+                for z in self._neighbors[x]:
+                    if z != y and (z, x) not in in_queue:
+                        arcs_list.append((z, x))
+                        in_queue.add((z, x))
         return True
 
     def assignment_complete(self, assignment):
@@ -205,6 +311,19 @@ class CrosswordCreator():
 
         return is_consistent
 
+    def fits_neighbors(self, var, word, assignment):
+        """
+        Return True if `word` for variable id `var` has the same character
+        as every assigned neighbor at their overlap; return False otherwise.
+        """
+        for neighbor in self._neighbors[var]:
+            neighbor_word = assignment.get(self.variables[neighbor])
+            if neighbor_word is not None:
+                i, j = self._overlap[var, neighbor]
+                if word[i] != neighbor_word[j]:
+                    return False
+        return True
+
     def order_domain_values(self, var, assignment):
         """
         Return a list of values in the domain of `var`, in order by
@@ -212,20 +331,46 @@ class CrosswordCreator():
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
         """
+        changes = self.values_ruled_out(var, assignment)
+        return sorted(changes, key=changes.get)  # convert to sorted list of keys
+
+    def least_constraining_values(self, var, assignment):
+        """
+        Yield the values in the domain of `var` in the same order as
+        `order_domain_values`, sorting only as many values as are requested.
+        """
+        changes = self.values_ruled_out(var, assignment)
+        start = 0
+        k = min(8, len(changes))
+        while start < len(changes):
+            # nsmallest matches sorted()[:k], so each batch extends the last
+            yield from heapq.nsmallest(k, changes, key=changes.get)[start:]
+            start = k
+            k = min(2 * k, len(changes))
+
+    def values_ruled_out(self, var, assignment):
+        """
+        Return a dict mapping each value in the domain of `var` to the
+        number of values it rules out among unassigned neighbors of `var`.
+        """
+        var = self.var_ids[var]
+
+        # words sharing a character at an overlap rule out the same neighbor
+        # values, so count the neighbor's words per character just once
+        neighbors = []
+        for neighbor in self._neighbors[var]:
+            if self.variables[neighbor] not in assignment:
+                i, j = self._overlap[var, neighbor]
+                matching = self.popcount(self.by_letter_at[neighbor][j] & self.domains[neighbor])
+                neighbors.append((i, int(self.popcount(self.domains[neighbor])), matching.tolist()))
+
         # keep track of changes for value in domain of var
         changes = dict()
-        for word in self.domains[var]:
-            vals_ruled_out = 0
-            for neighbor in self.crossword.neighbors(var):
-                if neighbor not in assignment:
-                    overlap = self.crossword.overlaps[var, neighbor]
-                    # check if any word in neighbour gets ruled out
-                    for n_word in self.domains[neighbor]:
-                        if word[overlap[0]] != n_word[overlap[1]]:
-                            vals_ruled_out += 1
-            changes[word] = vals_ruled_out  # populate the dict
-
-        return sorted(changes, key=changes.get)  # convert to sorted list of keys
+        for word in self.domain_words(var):
+            changes[word] = sum(
+                size - matching[self.letter_ids[word[i]]] for i, size, matching in neighbors
+            )
+        return changes
 
     def select_unassigned_variable(self, assignment):
         """
@@ -239,7 +384,7 @@ class CrosswordCreator():
 
         for var in self.crossword.variables:
             if var not in assignment:
-                domain_val_count[var] = len(self.domains[var])
+                domain_val_count[var] = self.popcount(self.domains[self.var_ids[var]])
 
         sorted_vars = sorted(domain_val_count.items(), key=lambda item: item[1])
 
@@ -256,7 +401,7 @@ class CrosswordCreator():
             return tied_vars[0][0]
 
         # if tied go for least-degree heuristic
-        final_sort = sorted(tied_vars, key=lambda item: len(self.crossword.neighbors(item[0])))
+        final_sort = sorted(tied_vars, key=lambda item: len(self._neighbors[self.var_ids[item[0]]]))
 
         return final_sort[0][0]
 
@@ -269,28 +414,36 @@ class CrosswordCreator():
 
         If no assignment is possible, return None.
         """
-        if self.assignment_complete(assignment):
+        if len(assignment) == len(self.variables):
             return assignment
         var = self.select_unassigned_variable(assignment)
+        var_id = self.var_ids[var]
+        used_words = set(assignment.values())
 
-        for val in self.order_domain_values(var, assignment):
-            assignment[var] = val  # add {var:val} to assignment
-            if self.consistent(assignment):  # check if consistent
+        for val in self.least_constraining_values(var, assignment):
+            # only the new value needs checking against the rest of the assignment
+            if val in used_words or not self.fits_neighbors(var_id, val, assignment):
+                continue
 
-                # arcs for the selected var
-                arcs = [(neighbor, var) for neighbor in self.crossword.neighbors(var)]
+            assignment[var] = val  # add {var:val} to assignment
+            saved_domains = list(self.domains)
 
-                # interleave search if cannot enforece arc consistency with the new assignment
-                if self.ac3(arcs) is None:
-                    del assignment[var]
-                    return None
+            # interleave search with arc consistency on the new assignment
+            self.domains[var_id] = self.word_mask([self.word_ids[val]])
+            self.letter_index[var_id].clear()
+            arcs = [(neighbor, var_id) for neighbor in self._neighbors[var_id]]
+            if self._ac3(arcs):
 
                 # recursively backtrack with this new assignment
                 result = self.backtrack(assignment)
                 if result is not None:  # if no issue, means found a solution so return the assignment
                     return result
-            else:
-                del assignment[var]  # not consistent so remove {var:val}
+
+            # no solution with {var:val} so undo it and any domain pruning
+            self.domains = saved_domains
+            for letters in self.letter_index:
+                letters.clear()
+            del assignment[var]
         return None
 
 
@@ -2,6 +2,9 @@ import csv
 import itertools
 import sys
 
+import numpy as np
+from numba import get_num_threads, njit, prange
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -36,6 +39,14 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Probability of passing the gene on, indexed by the parent's gene count
+PASS = (PROBS["mutation"], 0.5, 1 - PROBS["mutation"])
+
+# Trait probabilities indexed by [gene count, has trait]
+TRAIT_GIVEN_GENE = np.array([
+    [PROBS["trait"][g][False], PROBS["trait"][g][True]] for g in range(3)
+])
+
 
 def main():
 
@@ -43,6 +54,7 @@ def main():
     if len(sys.argv) != 2:
         sys.exit("Usage: python heredity.py data.csv")
     people = load_data(sys.argv[1])
+    family = index_family(people)
 
     # Keep track of gene and trait probabilities for each person
     probabilities = {
@@ -60,26 +72,34 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+    # Sets of people are represented as bitmasks, bit i standing for names[i]
+    names, mother_idx, father_idx = family
+
+    # Bits for people whose trait is known, and for those known to have it
+    evidence_known_mask = sets_to_mask(
+        names, {person for person in names if people[person]["trait"] is not None}
+    )
+    evidence_value_mask = sets_to_mask(
+        names, {person for person in names if people[person]["trait"]}
+    )
+
+    # Only sets of trait holders that agree with the evidence are possible:
+    # the known bits are fixed and the unknown bits range over all subsets
+    unknown_mask = ((1 << len(names)) - 1) & ~evidence_known_mask
+    trait_masks = np.array(
+        [evidence_value_mask | mask for mask in submasks(unknown_mask)], dtype=np.int64
+    )
+
+    # Sum joint probabilities over every assignment consistent with evidence
+    gene_totals, trait_totals = tally(
+        len(names), trait_masks, mother_idx, father_idx, FACTOR, get_num_threads()
+    )
+
+    for i, person in enumerate(names):
+        for value in probabilities[person]["gene"]:
+            probabilities[person]["gene"][value] = float(gene_totals[i, value])
+        for value in probabilities[person]["trait"]:
+            probabilities[person]["trait"][value] = float(trait_totals[i, int(value)])
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
@@ -116,6 +136,55 @@ def load_data(filename):
     return data
 
 
+def index_family(people):
+    """
+    Assign each person in `people` an integer index.
+    Return a tuple (names, mother_idx, father_idx), where `names` lists the
+    people in index order and `mother_idx`, `father_idx` are integer arrays
+    holding the index of each person's parents (-1 if unknown).
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    mother_idx = np.array(
+        [index.get(people[name]["mother"], -1) for name in names], dtype=np.intp
+    )
+    father_idx = np.array(
+        [index.get(people[name]["father"], -1) for name in names], dtype=np.intp
+    )
+    return (names, mother_idx, father_idx)
+
+
+def sets_to_mask(names, s):
+    """
+    Return an integer bitmask of set `s`, where bit i is set if `names[i]`
+    is in `s`.
+    """
+    mask = 0
+    for i, name in enumerate(names):
+        if name in s:
+            mask |= 1 << i
+    return mask
+
+
+def mask_bits(mask, n):
+    """
+    Return an array of the lowest `n` bits of the integer bitmask `mask`.
+    """
+    return (mask >> np.arange(n)) & 1
+
+
+def submasks(mask):
+    """
+    Yield every submask of the integer bitmask `mask`, from `mask` down to 0.
+    """
+    sub = mask
+    while True:
+        yield sub
+        if sub == 0:
+            return
+        sub = (sub - 1) & mask
+
+
 def powerset(s):
     """
     Return a list of all possible subsets of set s.
@@ -128,16 +197,41 @@ def powerset(s):
     ]
 
 
-def get_pass_prob(gene_count):
+# Gene count slot used for a parent that is not known
+UNKNOWN = 3
+
+
+def gene_factor(gene_count, mother_gene, father_gene):
+    """
+    Return the probability of a person having `gene_count` copies of the
+    gene, given the gene counts of their parents (UNKNOWN if not known).
+    """
+    if mother_gene == UNKNOWN and father_gene == UNKNOWN:
+        # No parental info, use unconditional gene probability
+        return PROBS["gene"][gene_count]
+
+    # a single unknown parent is treated as having no copies of the gene
+    pass_mother = PASS[mother_gene % UNKNOWN]
+    pass_father = PASS[father_gene % UNKNOWN]
     if gene_count == 2:
-        return 1 - PROBS["mutation"]
+        return pass_mother * pass_father
     elif gene_count == 1:
-        return 0.5
-    else:
-        return PROBS["mutation"]
+        return pass_mother * (1 - pass_father) + (1 - pass_mother) * pass_father
+    else:  # 0
+        return (1 - pass_mother) * (1 - pass_father)
+
+
+# Per-person gene probabilities indexed by [gene count, mother's, father's]
+GENE_FACTOR = np.array([
+    [[gene_factor(g, m, f) for f in range(4)] for m in range(4)]
+    for g in range(3)
+])
 
+# Per-person joint probabilities indexed by [gene count, mother's, father's, has trait]
+FACTOR = GENE_FACTOR[:, :, :, np.newaxis] * TRAIT_GIVEN_GENE[:, np.newaxis, np.newaxis, :]
 
-def joint_probability(people, one_gene, two_genes, have_trait):
+
+def joint_probability(people, one_gene, two_genes, have_trait, family=None):
     """
     Compute and return a joint probability.
 
@@ -147,51 +241,93 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone not in `one_gene` or `two_gene` does not have the gene, and
         * everyone in set `have_trait` has the trait, and
         * everyone not in set` have_trait` does not have the trait.
+
+    `family` is the result of `index_family(people)`; it is computed here
+    if not given.
     """
-    prob = 1
+    if family is None:
+        family = index_family(people)
+    names = family[0]
+    n = len(names)
 
-    for person in people:
-        gene_count = (
-            2 if person in two_genes else
-            1 if person in one_gene else
-            0
-        )
+    # gene count and trait of every person, in index order
+    one_bits = mask_bits(sets_to_mask(names, one_gene), n)
+    two_bits = mask_bits(sets_to_mask(names, two_genes), n)
+    gene_count = np.where(two_bits == 1, 2, one_bits)
+    has_trait = mask_bits(sets_to_mask(names, have_trait), n)
 
-        mother = people[person]["mother"]
-        father = people[person]["father"]
+    return family_probability(family, gene_count, has_trait)
 
-        if mother is None and father is None:
-            # No parental info, use unconditional gene probability
-            prob *= PROBS["gene"][gene_count]
-        else:
-            # Parents exist, compute from inheritance
-            mother_gene = (
-                2 if mother in two_genes else
-                1 if mother in one_gene else
-                0
-            )
-            father_gene = (
-                2 if father in two_genes else
-                1 if father in one_gene else
-                0
-            )
-
-            pass_mother = get_pass_prob(mother_gene)
-            pass_father = get_pass_prob(father_gene)
-
-            if gene_count == 2:
-                gene_prob = pass_mother * pass_father
-            elif gene_count == 1:
-                gene_prob = pass_mother * (1 - pass_father) + (1 - pass_mother) * pass_father
-            else:  # 0
-                gene_prob = (1 - pass_mother) * (1 - pass_father)
-
-            prob *= gene_prob
-
-        # Multiply by trait probability
-        prob *= PROBS["trait"][gene_count][person in have_trait]
-
-    return prob
+
+def family_probability(family, gene_count, has_trait):
+    """
+    Return the joint probability of every person in `family` having
+    `gene_count[i]` copies of the gene and trait `has_trait[i]` (0 or 1),
+    where both arrays are in the index order of `index_family`.
+    """
+    _, mother_idx, father_idx = family
+    return jp_kernel(gene_count, has_trait, mother_idx, father_idx, FACTOR)
+
+
+@njit(cache=True)
+def jp_kernel(gene_count, has_trait, mother_idx, father_idx, factor):
+    """
+    Return the product over every person of
+    `factor[gene count, mother's gene count, father's gene count, has trait]`.
+    """
+    p = 1.0
+    for i in range(gene_count.shape[0]):
+        mother_gene = gene_count[mother_idx[i]] if mother_idx[i] >= 0 else UNKNOWN
+        father_gene = gene_count[father_idx[i]] if father_idx[i] >= 0 else UNKNOWN
+        p *= factor[gene_count[i], mother_gene, father_gene, has_trait[i]]
+    return p
+
+
+@njit(parallel=True, cache=True)
+def tally(n, trait_masks, mother_idx, father_idx, factor, threads):
+    """
+    Add up the joint probability of every assignment of gene counts to the
+    `n` people, together with each set of trait holders in `trait_masks`,
+    splitting the work across `threads` threads.
+    Return arrays of totals indexed by [person, gene count] and
+    [person, has trait].
+    """
+    everyone = (1 << n) - 1
+
+    # Each thread tallies a strided share of the trait sets into its own slice
+    gene_out = np.zeros((threads, n, 3))
+    trait_out = np.zeros((threads, n, 2))
+    for t in prange(threads):
+        gene_count = np.empty(n, dtype=np.int64)
+        has_trait = np.empty(n, dtype=np.int64)
+
+        # Loop over all sets of people who might have the trait
+        for k in range(t, trait_masks.shape[0], threads):
+            trait_mask = trait_masks[k]
+            for i in range(n):
+                has_trait[i] = (trait_mask >> i) & 1
+
+            # Loop over all sets of people who might have the gene
+            for one_mask in range(1 << n):
+
+                # Enumerate every subset of the people not in one_mask
+                others = everyone & ~one_mask
+                two_mask = others
+                while True:
+                    for i in range(n):
+                        gene_count[i] = ((one_mask >> i) & 1) + 2 * ((two_mask >> i) & 1)
+
+                    # Update totals with new joint probability
+                    p = jp_kernel(gene_count, has_trait, mother_idx, father_idx, factor)
+                    for i in range(n):
+                        gene_out[t, i, gene_count[i]] += p
+                        trait_out[t, i, has_trait[i]] += p
+
+                    if two_mask == 0:
+                        break
+                    two_mask = (two_mask - 1) & others
+
+    return gene_out.sum(axis=0), trait_out.sum(axis=0)
 
 
 def update(probabilities, one_gene, two_genes, have_trait, p):
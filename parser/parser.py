@@ -1,4 +1,5 @@
 import nltk
+import re
 import sys
 
 TERMINALS = """
@@ -23,7 +24,11 @@ VP -> V | V NP | V NP PP | V Adv | Conj V | Det V | V PP | Adv V
 """
 
 grammar = nltk.CFG.fromstring(NONTERMINALS + TERMINALS)
-parser = nltk.ChartParser(grammar)
+parser = nltk.parse.BottomUpLeftCornerChartParser(grammar)
+
+# word tokenizer and alphabetic-character test used by preprocess
+tokenizer = nltk.tokenize.RegexpTokenizer(r"\w+(?:['-]\w+)*")
+alpha = re.compile(r"[^\W\d_]")
 
 
 def main():
@@ -67,9 +72,9 @@ def preprocess(sentence):
     character.
     """
     # tokenize all words in the sentence
-    token_list = nltk.tokenize.word_tokenize(sentence)
+    token_list = tokenizer.tokenize(sentence)
     # filter out words with atleast one alpha and lower case
-    filtered = [s.lower() for s in token_list if any(c.isalpha() for c in s)]
+    filtered = [s.lower() for s in token_list if alpha.search(s)]
     return filtered
 
 
@@ -82,16 +87,25 @@ def np_chunk(tree):
     """
     # initialize result of nps
     nps = []
-    # check all child trees which are NP
-    for child in tree.subtrees(lambda t: t.label() == "NP"):
-        is_np = True
-        # check if any sub child is also NP
-        for sub in child.subtrees():
-            if sub != child and sub.label() == "NP":
-                is_np = False
+
+    def walk(t):
+        """
+        Visit `t` in post-order, collecting NP chunks.
+        Return True if `t` is or contains a noun phrase.
+        """
+        # check if any child is an NP or contains one
+        contains_np = False
+        for child in t:
+            if isinstance(child, nltk.Tree) and walk(child):
+                contains_np = True
+
+        is_np = t.label() == "NP"
         # if no child which is NP add to result
-        if is_np:
-            nps.append(child)
+        if is_np and not contains_np:
+            nps.append(t)
+        return is_np or contains_np
+
+    walk(tree)
     return nps
 
 
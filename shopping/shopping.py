@@ -1,8 +1,11 @@
-import csv
 import sys
 
+import numpy as np
+import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 
 TEST_SIZE = 0.4
 
@@ -21,6 +24,24 @@ MONTHS = {
     "Dec": 11
 }
 
+# Column types of the numeric fields in the CSV file
+DTYPES = {
+    "Administrative": "int32",
+    "Administrative_Duration": "float64",
+    "Informational": "int32",
+    "Informational_Duration": "float64",
+    "ProductRelated": "int32",
+    "ProductRelated_Duration": "float64",
+    "BounceRates": "float64",
+    "ExitRates": "float64",
+    "PageValues": "float64",
+    "SpecialDay": "float64",
+    "OperatingSystems": "int32",
+    "Browser": "int32",
+    "Region": "int32",
+    "TrafficType": "int32"
+}
+
 
 def main():
 
@@ -30,6 +51,8 @@ def main():
 
     # Load data from spreadsheet and split into train and test sets
     evidence, labels = load_data(sys.argv[1])
+    evidence = np.asarray(evidence, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int8)
     X_train, X_test, y_train, y_test = train_test_split(
         evidence, labels, test_size=TEST_SIZE
     )
@@ -48,10 +71,10 @@ def main():
 
 def load_data(filename):
     """
-    Load shopping data from a CSV file `filename` and convert into a list of
-    evidence lists and a list of labels. Return a tuple (evidence, labels).
+    Load shopping data from a CSV file `filename` and convert into an array of
+    evidence rows and an array of labels. Return a tuple (evidence, labels).
 
-    evidence should be a list of lists, where each list contains the
+    evidence should be a 2D NumPy array, where each row contains the
     following values, in order:
         - Administrative, an integer
         - Administrative_Duration, a floating point number
@@ -71,55 +94,39 @@ def load_data(filename):
         - VisitorType, an integer 0 (not returning) or 1 (returning)
         - Weekend, an integer 0 (if false) or 1 (if true)
 
-    labels should be the corresponding list of labels, where each label
+    labels should be the corresponding array of labels, where each label
     is 1 if Revenue is true, and 0 otherwise.
     """
 
     # read data and prepare for training
-    with open(filename) as f:
-        reader = csv.reader(f)
-        next(reader)
-
-        # initialize empty evidence and lavels
-        evidence = []
-        labels = []
-
-        for row in reader:
-            # add inputs to evidence
-            evidence.append([
-                int(row[0]),
-                float(row[1]),
-                int(row[2]),
-                float(row[3]),
-                int(row[4]),
-                float(row[5]),
-                float(row[6]),
-                float(row[7]),
-                float(row[8]),
-                float(row[9]),
-                MONTHS[row[10]],
-                int(row[11]),
-                int(row[12]),
-                int(row[13]),
-                int(row[14]),
-                1 if row[15] == "Returning_Visitor" else 0,
-                1 if row[16] == "TRUE" else 0,
-            ])
-
-            # add "revenue" to label
-            labels.append(1 if row[17] == "TRUE" else 0)
-
-        return (evidence, labels)
+    data = pd.read_csv(
+        filename, dtype=DTYPES, true_values=["TRUE"], false_values=["FALSE"]
+    )
+
+    # convert non-numeric inputs to integers
+    data["Month"] = data["Month"].map(MONTHS).astype("int8")
+    data["VisitorType"] = (data["VisitorType"] == "Returning_Visitor").astype("int8")
+    data["Weekend"] = data["Weekend"].astype("int8")
+
+    # split inputs into evidence and "revenue" into labels
+    evidence = data.drop(columns="Revenue").to_numpy()
+    labels = data["Revenue"].astype("int8").to_numpy()
+
+    return (evidence, labels)
 
 
 def train_model(evidence, labels):
     """
-    Given a list of evidence lists and a list of labels, return a
+    Given an array of evidence rows and an array of labels, return a
     fitted k-nearest neighbor model (k=1) trained on the data.
+    Features are standardized before distances are computed.
     """
 
-    # initialize k-neighbors classifier with k=1
-    model = KNeighborsClassifier(n_neighbors=1)
+    # initialize k-neighbors classifier with k=1 on a KD-tree, querying on all cores
+    model = make_pipeline(
+        StandardScaler(),
+        KNeighborsClassifier(n_neighbors=1, algorithm="kd_tree", leaf_size=40, n_jobs=-1)
+    )
     model.fit(evidence, labels)  # fit model with given evidence and labels
     return model
 
@@ -139,24 +146,20 @@ def evaluate(labels, predictions):
     representing the "true negative rate": the proportion of
     actual negative labels that were accurately identified.
     """
-    # initialize true positives and actual positives
-    true_positives = 0
-    true_negatives = 0
-    actual_positives = 0
-    actual_negatives = 0
-
-    for actual, predicted in zip(labels, predictions):
-        if actual == 1:
-            actual_positives += 1
-            if actual == predicted:  # correct true prediction
-                true_positives += 1
-        else:
-            actual_negatives += 1
-            if actual == predicted:  # correct false prediction
-                true_negatives += 1
+    labels = np.asarray(labels, dtype=np.int8)
+    predictions = np.asarray(predictions, dtype=np.int8)
+
+    # count true positives and actual positives
+    true_positives = int(((labels == 1) & (predictions == 1)).sum())
+    true_negatives = int(((labels == 0) & (predictions == 0)).sum())
+    actual_positives = int((labels == 1).sum())
+    actual_negatives = labels.size - actual_positives
 
     # calculate and return sensitivity and specificty
-    return (float(true_positives/actual_positives), float(true_negatives/actual_negatives))
+    return (
+        true_positives / max(actual_positives, 1),
+        true_negatives / max(actual_negatives, 1)
+    )
 
 
 if __name__ == "__main__":